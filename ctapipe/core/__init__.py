@@ -4,7 +4,7 @@ Core functionality of ctapipe
 """
 
 from .component import Component, TelescopeComponent, non_abstract_children
-from .container import Container, Field, DeprecatedField, Map
+from .container import Container, Field, DeprecatedField, LazyField, Map, set_lazy
 from .provenance import Provenance, get_module_version
 from .tool import Tool, ToolConfigurationError, run_tool
 from .qualityquery import QualityQuery, QualityCriteriaError
@@ -16,7 +16,9 @@ __all__ = [
     "Tool",
     "Field",
     "DeprecatedField",
+    "LazyField",
     "Map",
+    "set_lazy",
     "Provenance",
     "ToolConfigurationError",
     "non_abstract_children",
@@ -1,10 +1,61 @@
 from collections import defaultdict
 from copy import deepcopy
+from operator import attrgetter
 from pprint import pformat
 from textwrap import wrap
 import warnings
 
 
+_IMMUTABLE_TYPES = (type(None), bool, int, float, complex, str, bytes)
+
+
+def _defaults_match(value, fresh_value):
+    """
+    Check whether `value` taken from a sub-container default equals the
+    corresponding value of a freshly constructed instance.  NaN defaults
+    compare unequal to themselves but still count as matching; any
+    ambiguous comparison (e.g. arrays) counts as a mismatch.
+    """
+    if value is fresh_value:
+        return True
+
+    if isinstance(value, Container):
+        return type(value) is type(fresh_value) and all(
+            _defaults_match(value[k], fresh_value[k]) for k in value.fields
+        )
+
+    try:
+        if bool(value == fresh_value):
+            return True
+        return bool(value != value) and bool(fresh_value != fresh_value)
+    except Exception:
+        return False
+
+
+def _default_factory(default):
+    """
+    Return the cheapest zero-argument callable that produces a fresh
+    copy of `default`, avoiding `deepcopy` for values that do not need it.
+    """
+    if isinstance(default, _IMMUTABLE_TYPES):
+        return lambda: default
+
+    if isinstance(default, tuple) and all(
+        isinstance(v, _IMMUTABLE_TYPES) for v in default
+    ):
+        return lambda: default
+
+    if isinstance(default, Container):
+        # sub-container defaults are usually pristine instances, in which
+        # case constructing a new one is equivalent to (and much cheaper
+        # than) deep-copying; a customized default, e.g.
+        # Field(SomeContainer(x=5)), must still be copied
+        if _defaults_match(default, type(default)()):
+            return type(default)
+
+    return lambda: deepcopy(default)
+
+
 class Field:
     """
     Class for storing data in `Containers`.
@@ -28,18 +79,92 @@ class Field:
         self.unit = unit
         self.ucd = ucd
 
+        # the attributes are fixed after construction, so the repr string
+        # can be rendered once here instead of on every call (e.g. for
+        # each field whenever a Container is repr'd)
+        desc = f"{description}"
+        if unit is not None:
+            desc += f" [{unit}]"
+        self._repr = desc
+
     def __repr__(self):
-        desc = f"{self.description}"
-        if self.unit is not None:
-            desc += f" [{self.unit}]"
-        return desc
+        return self._repr
+
+
+class LazyField(Field):
+    """
+    A `Field` whose value may be set to a deferred computation via
+    `set_lazy`.  The computation runs on the first read of the field and
+    its result is stored in place of the thunk, so producers can fill
+    expensive fields without paying for them on events that are
+    discarded before the field is ever read.
+    """
+
+
+class _Thunk:
+    """ deferred computation stored in a `LazyField` by `set_lazy` """
+
+    __slots__ = ("func",)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self):
+        return self.func()
+
+
+class _LazySlot:
+    """
+    Data descriptor wrapping the slot of a `LazyField`, resolving a
+    stored `_Thunk` on first read.  Reads of already-resolved values pay
+    only one isinstance check on top of the slot access.
+    """
+
+    __slots__ = ("slot",)
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self.slot.__get__(instance, owner)
+        if isinstance(value, _Thunk):
+            value = value()
+            self.slot.__set__(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+
+
+def set_lazy(container, name, func):
+    """
+    Store the zero-argument callable `func` as deferred value of the
+    `LazyField` `name` of `container`; it is evaluated when the field is
+    first read.
+    """
+    if not isinstance(container.fields[name], LazyField):
+        # a regular field would store the raw thunk as its value and
+        # leak it into the output writers
+        raise TypeError(
+            f"{type(container).__name__}.{name} is not a LazyField"
+        )
+    setattr(container, name, _Thunk(func))
 
 
 class DeprecatedField(Field):
     """ used to mark which fields may be removed in next version """
     def __init__(self, default, description="", unit=None, ucd=None, reason=""):
         super().__init__(default=default, description=description, unit=unit, ucd=ucd)
-        warnings.warn(f"Field {self} is deprecated. {reason}", DeprecationWarning)
+        # the warning is emitted once per field definition (not per access),
+        # so deprecated fields add no cost to the per-event hot path;
+        # stacklevel=2 attributes it to the container class defining the field
+        warnings.warn(
+            f"Field {self} is deprecated. {reason}",
+            DeprecationWarning,
+            stacklevel=2,
+        )
         self.reason = reason
 
 
@@ -59,7 +184,25 @@ class ContainerMeta(type):
 
     def __new__(cls, name, bases, dct):
         field_names = [k for k, v in dct.items() if isinstance(v, Field)]
-        dct["__slots__"] = tuple(field_names + ["meta", "prefix"])
+
+        # lazy fields store their value in a hidden slot; the visible name
+        # becomes a descriptor resolving deferred values on first read
+        lazy_names = [k for k in field_names if isinstance(dct[k], LazyField)]
+        slot_names = [
+            "_" + k if isinstance(dct[k], LazyField) else k for k in field_names
+        ]
+
+        # only reserve slots that are not already provided by a base class,
+        # otherwise each subclass would allocate additional, shadowed storage
+        # for `meta`, `prefix` and overridden fields in every instance
+        inherited_slots = set()
+        for b in bases:
+            for base in b.__mro__:
+                inherited_slots.update(getattr(base, "__slots__", ()))
+
+        dct["__slots__"] = tuple(
+            k for k in slot_names + ["meta", "prefix"] if k not in inherited_slots
+        )
         dct["fields"] = {}
 
         # inherit fields from baseclasses
@@ -71,12 +214,57 @@ class ContainerMeta(type):
         for k in field_names:
             dct["fields"][k] = dct.pop(k)
 
+        for f in dct["fields"].values():
+            if not hasattr(f, "make_default"):
+                f.make_default = _default_factory(f.default)
+
         new_cls = type.__new__(cls, name, bases, dct)
 
+        for k in lazy_names:
+            setattr(new_cls, k, _LazySlot(getattr(new_cls, "_" + k)))
+
         # if prefix was not set as a class variable, build a default one
         if "container_prefix" not in dct:
             new_cls.container_prefix = name.lower().replace("container", "")
 
+        # pre-build the key strings used by items(add_prefix=True), so the
+        # common case does not re-concatenate them per call. `_cached_prefix`
+        # records which prefix they were built for, since the prefix can be
+        # changed on the class or per instance at runtime.
+        new_cls._cached_prefix = new_cls.container_prefix
+        new_cls._prefixed_keys = tuple(
+            f"{new_cls.container_prefix}_{k}" for k in new_cls.fields
+        )
+
+        # frozen copies of the (immutable after class creation) fields dict,
+        # so per-call iteration walks a tuple instead of allocating dict views
+        new_cls._fields_tuple = tuple(new_cls.fields.items())
+        new_cls._field_names = tuple(new_cls.fields)
+
+        # partition the fields once, so reset() does not have to re-check
+        # per call which of them hold sub-containers
+        new_cls._container_field_names = tuple(
+            k for k, f in new_cls.fields.items() if isinstance(f.default, Container)
+        )
+        container_field_names = set(new_cls._container_field_names)
+        new_cls._scalar_field_names = tuple(
+            k for k in new_cls.fields if k not in container_field_names
+        )
+
+        # single C-level getter fetching all field values at once, used by
+        # values()/items(); attrgetter returns a bare value for one name
+        # and cannot be built for zero names, so special-case those
+        all_names = tuple(new_cls.fields)
+        if len(all_names) == 0:
+            new_cls._get_values = staticmethod(lambda container: ())
+        elif len(all_names) == 1:
+            getter = attrgetter(all_names[0])
+            new_cls._get_values = staticmethod(
+                lambda container, getter=getter: (getter(container),)
+            )
+        else:
+            new_cls._get_values = attrgetter(*all_names)
+
         return new_cls
 
 
@@ -136,8 +324,16 @@ class Container(metaclass=ContainerMeta):
         # and an instance variable `prefix` in `__slots__`
         self.prefix = self.container_prefix
 
-        for k in set(self.fields).difference(fields):
-            setattr(self, k, deepcopy(self.fields[k].default))
+        # common case: no keyword arguments, fill every slot from its
+        # default factory without building the set difference
+        if not fields:
+            for k, f in self._fields_tuple:
+                setattr(self, k, f.make_default())
+            return
+
+        for k, f in self._fields_tuple:
+            if k not in fields:
+                setattr(self, k, f.make_default())
 
         for k, v in fields.items():
             setattr(self, k, v)
@@ -149,19 +345,24 @@ class Container(metaclass=ContainerMeta):
         return setattr(self, key, value)
 
     def items(self, add_prefix=False):
-        """Generator over (key, value) pairs for the items"""
+        """Iterator over (key, value) pairs for the items"""
         if not add_prefix or self.prefix == "":
-            return ((k, getattr(self, k)) for k in self.fields.keys())
+            return zip(self._field_names, self._get_values(self))
+
+        if self.prefix == self._cached_prefix:
+            keys = self._prefixed_keys
+        else:
+            keys = tuple(self.prefix + "_" + k for k in self._field_names)
 
-        return ((self.prefix + "_" + k, getattr(self, k)) for k in self.fields.keys())
+        return zip(keys, self._get_values(self))
 
     def keys(self):
         """Get the keys of the container"""
-        return self.fields.keys()
+        return self._field_names
 
     def values(self):
-        """Get the keys of the container"""
-        return (getattr(self, k) for k in self.fields.keys())
+        """Get the values of the container"""
+        return self._get_values(self)
 
     def as_dict(self, recursive=False, flatten=False, add_prefix=False):
         """
@@ -178,36 +379,43 @@ class Container(metaclass=ContainerMeta):
             include the container's prefix in the name of each item
         """
         if not recursive:
-            return dict(self.items(add_prefix=add_prefix))
-        else:
+            # common call shape in the table writers: all defaults
+            if not add_prefix:
+                return dict(zip(self._field_names, self._get_values(self)))
+            return dict(self.items(add_prefix=True))
+
+        if flatten:
             d = dict()
-            for key, val in self.items(add_prefix=add_prefix):
-                if isinstance(val, Container) or isinstance(val, Map):
-                    if flatten:
-                        d.update(
-                            {
-                                f"{key}_{k}": v
-                                for k, v in val.as_dict(
-                                    recursive, add_prefix=add_prefix
-                                ).items()
-                            }
-                        )
-                    else:
-                        d[key] = val.as_dict(
-                            recursive=recursive, flatten=flatten, add_prefix=add_prefix
-                        )
-                else:
-                    d[key] = val
+            _flatten_into(d, self, add_prefix)
             return d
 
+        d = dict()
+        for key, val in self.items(add_prefix=add_prefix):
+            if isinstance(val, Container) or isinstance(val, Map):
+                d[key] = val.as_dict(
+                    recursive=recursive, flatten=flatten, add_prefix=add_prefix
+                )
+            else:
+                d[key] = val
+        return d
+
     def reset(self, recursive=True):
         """ set all values back to their default values"""
-        for name, value in self.fields.items():
-            if isinstance(value, Container):
-                if recursive:
-                    getattr(self, name).reset()
-            else:
-                setattr(self, name, deepcopy(self.fields[name].default))
+        if recursive:
+            for name in self._container_field_names:
+                value = getattr(self, name)
+                if isinstance(value, Container):
+                    value.reset()
+                else:
+                    # fields are not type-checked on assignment, so a
+                    # container field may hold e.g. None; rebuild it
+                    setattr(self, name, self.fields[name].make_default())
+        else:
+            for name in self._container_field_names:
+                setattr(self, name, self.fields[name].make_default())
+
+        for name in self._scalar_field_names:
+            setattr(self, name, self.fields[name].make_default())
 
     def update(self, **values):
         """
@@ -217,12 +425,24 @@ class Container(metaclass=ContainerMeta):
         for key in values:
             self[key] = values[key]
 
-    def __str__(self):
+    def pretty(self):
+        """ full, recursive pretty-print of the container contents """
         return pformat(self.as_dict(recursive=True))
 
+    def __str__(self):
+        # keep this cheap: show only the top-level non-container values,
+        # so logging a container does not walk the whole hierarchy and
+        # pretty-print it; use pretty() for the deep version
+        scalars = ", ".join(
+            f"{k}={v!r}"
+            for k, v in zip(self._field_names, self._get_values(self))
+            if not isinstance(v, (Container, Map))
+        )
+        return f"{type(self).__name__}({scalars})"
+
     def __repr__(self):
         text = ["{}.{}:".format(type(self).__module__, type(self).__name__)]
-        for name, item in self.fields.items():
+        for name, item in self._fields_tuple:
             extra = ""
             if isinstance(getattr(self, name), Container):
                 extra = ".*"
@@ -240,31 +460,58 @@ class Map(defaultdict):
     by `tel_id` or algorithm name).
     """
 
+    # no per-instance attributes beyond the dict itself; drops the
+    # instance __dict__ that the defaultdict subclass would otherwise
+    # carry for every map in every event
+    __slots__ = ()
+
     def as_dict(self, recursive=False, flatten=False, add_prefix=False):
         if not recursive:
             return dict(self.items())
-        else:
+
+        if flatten:
             d = dict()
-            for key, val in self.items():
-                if isinstance(val, Container) or isinstance(val, Map):
-                    if flatten:
-                        d.update(
-                            {
-                                f"{key}_{k}": v
-                                for k, v in val.as_dict(
-                                    recursive, add_prefix=add_prefix
-                                ).items()
-                            }
-                        )
-                    else:
-                        d[key] = val.as_dict(
-                            recursive=recursive, flatten=flatten, add_prefix=add_prefix
-                        )
-                    continue
-                d[key] = val
+            _flatten_into(d, self, add_prefix)
             return d
 
+        d = dict()
+        for key, val in self.items():
+            if isinstance(val, Container) or isinstance(val, Map):
+                d[key] = val.as_dict(
+                    recursive=recursive, flatten=flatten, add_prefix=add_prefix
+                )
+                continue
+            d[key] = val
+        return d
+
     def reset(self, recursive=True):
         for val in self.values():
             if isinstance(val, Container):
                 val.reset(recursive=recursive)
+
+
+def _flatten_into(out, node, add_prefix):
+    """
+    Write all leaf values of the `Container` or `Map` `node` into the
+    dict `out`, joining nested keys with underscores.
+
+    Uses an explicit stack of (prefix, items-iterator) frames instead of
+    recursion, so only the single output dict is allocated regardless of
+    the nesting depth.
+    """
+
+    def _items(val):
+        if isinstance(val, Container):
+            return iter(val.items(add_prefix=add_prefix))
+        return iter(val.items())
+
+    stack = [("", _items(node))]
+    while stack:
+        prefix, items = stack[-1]
+        for key, val in items:
+            if isinstance(val, (Container, Map)):
+                stack.append((f"{prefix}{key}_", _items(val)))
+                break
+            out[f"{prefix}{key}"] = val
+        else:
+            stack.pop()
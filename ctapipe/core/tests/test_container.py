@@ -1,6 +1,6 @@
 # Licensed under a 3-clause BSD style license - see LICENSE.rst
 import pytest
-from ctapipe.core import Container, Field, Map, DeprecatedField
+from ctapipe.core import Container, Field, LazyField, Map, DeprecatedField, set_lazy
 
 
 def test_prefix():
@@ -129,6 +129,38 @@ def test_child_containers():
     assert cont.child.z == 1
 
 
+def test_child_container_defaults():
+    class ChildContainer(Container):
+        z = Field(1, "sub-item")
+
+    class ParentContainer(Container):
+        child = Field(ChildContainer(), "a child")
+
+    class CustomizedParentContainer(Container):
+        child = Field(ChildContainer(z=5), "a customized child")
+
+    # a customized sub-container default must be preserved, not replaced
+    # by the child class defaults
+    cont = CustomizedParentContainer()
+    assert cont.child.z == 5
+
+    # instances must never share a sub-container object, neither with
+    # each other nor with the default stored on the Field
+    c1 = ParentContainer()
+    c2 = ParentContainer()
+    assert c1.child is not c2.child
+    assert c1.child is not ParentContainer.fields["child"].default
+    c1.child.z = 99
+    assert c2.child.z == 1
+    assert ParentContainer().child.z == 1
+
+    c3 = CustomizedParentContainer()
+    c4 = CustomizedParentContainer()
+    assert c3.child is not c4.child
+    c3.child.z = 99
+    assert c4.child.z == 5
+
+
 def test_map_containers():
     class ChildContainer(Container):
         z = Field(1, "sub-item")
@@ -148,6 +180,21 @@ def test_map_containers():
     assert 5 not in cont.children
 
 
+def test_reset_overwritten_child():
+    class ChildContainer(Container):
+        z = Field(1, "sub-item")
+
+    class ParentContainer(Container):
+        child = Field(ChildContainer(), "a child")
+
+    # a container field may legally hold a placeholder like None;
+    # reset() must rebuild it from the default instead of raising
+    cont = ParentContainer()
+    cont.child = None
+    cont.reset()
+    assert cont.child.z == 1
+
+
 def test_container_as_dict():
     class ChildContainer(Container):
         z = Field(1, "sub-item")
@@ -165,6 +212,32 @@ def test_container_as_dict():
     assert "child" in the_dict and "z" in the_dict["child"]
 
 
+def test_container_as_dict_flatten_deep():
+    class GrandChildContainer(Container):
+        g = Field(3, "grandchild value")
+
+    class ChildContainer(Container):
+        z = Field(1, "sub-item")
+        grand = Field(GrandChildContainer(), "a grandchild")
+
+    class ParentContainer(Container):
+        x = Field(0, "some value")
+        child = Field(ChildContainer(), "a child")
+
+    cont = ParentContainer()
+
+    # flattening applies below the first nesting level as well
+    flat = cont.as_dict(recursive=True, flatten=True)
+    assert flat == {"x": 0, "child_z": 1, "child_grand_g": 3}
+
+    flat_prefixed = cont.as_dict(recursive=True, flatten=True, add_prefix=True)
+    assert flat_prefixed == {
+        "parent_x": 0,
+        "parent_child_child_z": 1,
+        "parent_child_child_grand_grandchild_g": 3,
+    }
+
+
 def test_container_brackets():
     class ExampleContainer(Container):
         answer = Field(-1, "The answer to all questions")
@@ -176,6 +249,57 @@ def test_container_brackets():
     with pytest.raises(AttributeError):
         t["foo"] = 5
 
+def test_container_str():
+    class ChildContainer(Container):
+        z = Field(1, "sub-item")
+
+    class ParentContainer(Container):
+        x = Field(0, "some value")
+        child = Field(ChildContainer(), "a child")
+
+    cont = ParentContainer()
+
+    # __str__ only shows the top-level scalar values
+    assert str(cont) == "ParentContainer(x=0)"
+
+    # the deep, pretty-printed version is available via pretty()
+    assert cont.pretty() == "{'child': {'z': 1}, 'x': 0}"
+
+
+def test_lazy_field():
+    class ExampleContainer(Container):
+        x = Field(-1, "eager value")
+        lazy = LazyField(-1, "computed on demand")
+
+    cont = ExampleContainer()
+    assert cont.lazy == -1
+
+    calls = []
+
+    def expensive():
+        calls.append(1)
+        return 42
+
+    set_lazy(cont, "lazy", expensive)
+    assert calls == []
+
+    # resolved on first read, then stored
+    assert cont.lazy == 42
+    assert cont.lazy == 42
+    assert calls == [1]
+
+    # items()/as_dict() see the resolved value, not the thunk
+    set_lazy(cont, "lazy", expensive)
+    assert cont.as_dict() == {"x": -1, "lazy": 42}
+
+    cont.reset()
+    assert cont.lazy == -1
+
+    # deferring a regular field would leak the thunk into the writers
+    with pytest.raises(TypeError):
+        set_lazy(cont, "x", expensive)
+
+
 def test_deprecated_field():
     class ExampleContainer(Container):
         answer = DeprecatedField(-1, "The answer to all questions", reason="because")
@@ -173,7 +173,7 @@ def npix_above_threshold(pix, thr):
         Number of pixels above threshold
     """
 
-    return (pix > thr).sum()
+    return np.count_nonzero(pix > thr)
 
 
 def npix_composing_ring(pix):
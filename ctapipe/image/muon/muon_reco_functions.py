@@ -1,10 +1,16 @@
+import hashlib
 import logging
+import os
+import struct
 import warnings
+from pathlib import Path
 
+import astropy
 import numpy as np
 from astropy import units as u
 from astropy.coordinates import Angle, SkyCoord, AltAz
 
+import ctapipe
 from ctapipe.coordinates import CameraFrame, NominalFrame
 from ..cleaning import tailcuts_clean
 from .features import ring_containment
@@ -16,6 +22,234 @@ from .ring_fitter import MuonRingFitter
 
 logger = logging.getLogger(__name__)
 
+_nominal_pixel_cache = {}
+# camera name / optics / pointing -> result, so telescopes sharing a
+# camera type resolve with one tuple lookup instead of rehashing the
+# pixel position arrays per telescope per event
+_nominal_pixel_fast_cache = {}
+
+# the cached values are derived coordinates, so the persistent key must
+# change whenever the code producing them can: salt it with the ctapipe
+# and astropy versions (frame transforms get bug fixes) and bump
+# _CACHE_VERSION to invalidate old entries by hand
+_CACHE_VERSION = 1
+_CACHE_KEY_SALT = (
+    f"{_CACHE_VERSION}:{ctapipe.__version__}:{astropy.__version__}:".encode()
+)
+
+
+def _nominal_pixel_positions(geom, focal_length, telescope_pointing):
+    """
+    Get the pixel positions of `geom` transformed into the `NominalFrame`
+    centered on `telescope_pointing`.
+
+    The transformation is fully determined by the pixel positions, the
+    focal length, the camera rotation and the pointing, so the result is
+    memoized in-process and additionally stored as an ``.npz`` file below
+    ``~/.cache/ctapipe``, which amortizes the astropy frame transform
+    across runs over the same subarray.
+
+    Returns
+    -------
+    delta_az, delta_alt: `astropy.units.Quantity`
+        pixel positions in the nominal frame, in degrees
+    """
+    focal_length_m = focal_length.to_value(u.m)
+    rotation_rad = geom.pix_rotation.to_value(u.rad)
+    alt_deg = telescope_pointing.alt.to_value(u.deg)
+    az_deg = telescope_pointing.az.to_value(u.deg)
+
+    fast_key = (
+        geom.camera_name,
+        geom.n_pixels,
+        focal_length_m,
+        rotation_rad,
+        alt_deg,
+        az_deg,
+    )
+    try:
+        return _nominal_pixel_fast_cache[fast_key]
+    except KeyError:
+        pass
+
+    key = hashlib.blake2b(
+        _CACHE_KEY_SALT
+        + geom.pix_x.to_value(u.m).tobytes()
+        + geom.pix_y.to_value(u.m).tobytes()
+        + struct.pack("dddd", focal_length_m, rotation_rad, alt_deg, az_deg)
+    ).hexdigest()
+
+    if key in _nominal_pixel_cache:
+        result = _nominal_pixel_cache[key]
+        _nominal_pixel_fast_cache[fast_key] = result
+        return result
+
+    cache_file = (
+        Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+        / "ctapipe"
+        / "nominal_pixel_positions"
+        / (key + ".npz")
+    )
+
+    try:
+        with np.load(cache_file) as f:
+            result = (f["delta_az"] * u.deg, f["delta_alt"] * u.deg)
+        _nominal_pixel_cache[key] = result
+        _nominal_pixel_fast_cache[fast_key] = result
+        return result
+    except Exception:
+        # a missing file is the normal cache miss; anything else (e.g. a
+        # corrupt or truncated file) must fall back to recomputing as well
+        pass
+
+    camera_coord = SkyCoord(
+        x=geom.pix_x,
+        y=geom.pix_y,
+        frame=CameraFrame(
+            focal_length=focal_length,
+            rotation=geom.pix_rotation,
+            telescope_pointing=telescope_pointing,
+        ),
+    )
+    nom_coord = camera_coord.transform_to(NominalFrame(origin=telescope_pointing))
+    result = (nom_coord.delta_az.to(u.deg), nom_coord.delta_alt.to(u.deg))
+    _nominal_pixel_cache[key] = result
+    _nominal_pixel_fast_cache[fast_key] = result
+
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # write via a per-process temp file and rename it into place, so
+        # concurrent jobs over the same subarray never see a partial file
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+        with open(tmp_file, "wb") as f:
+            np.savez(f, delta_az=result[0].value, delta_alt=result[1].value)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        logger.debug("could not write pixel position cache to %s", cache_file)
+
+    return result
+
+
+# static per-camera analysis cuts; built once at import instead of per event.
+# All these options should go to an input card eventually.
+names = [
+    "LST_LST_LSTCam",
+    "MST_MST_NectarCam",
+    "MST_MST_FlashCam",
+    "MST_SCT_SCTCam",
+    "SST_1M_DigiCam",
+    "SST_GCT_CHEC",
+    "SST_ASTRI_ASTRICam",
+    "SST_ASTRI_CHEC",
+]
+tail_cuts = [
+    (5, 7),
+    (5, 7),
+    (10, 12),
+    (5, 7),
+    (5, 7),
+    (5, 7),
+    (5, 7),
+    (5, 7),
+]  # 10, 12?
+impact = [
+    (0.2, 0.9),
+    (0.1, 0.95),
+    (0.2, 0.9),
+    (0.2, 0.9),
+    (0.1, 0.95),
+    (0.1, 0.95),
+    (0.1, 0.95),
+    (0.1, 0.95),
+] * u.m
+ringwidth = [
+    (0.04, 0.08),
+    (0.02, 0.1),
+    (0.01, 0.1),
+    (0.02, 0.1),
+    (0.01, 0.5),
+    (0.02, 0.2),
+    (0.02, 0.2),
+    (0.02, 0.2),
+] * u.deg
+total_pix = [1855.0, 1855.0, 1764.0, 11328.0, 1296.0, 2048.0, 2368.0, 2048]
+# 8% (or 6%) as limit
+min_pix = [148.0, 148.0, 141.0, 680.0, 104.0, 164.0, 142.0, 164]
+# Need to either convert from the pixel area in m^2 or check the camera specs
+ang_pixel_width = [0.1, 0.2, 0.18, 0.067, 0.24, 0.2, 0.17, 0.2, 0.163] * u.deg
+# Found from TDRs (or the pixel area)
+hole_rad = [
+    0.308 * u.m,
+    0.244 * u.m,
+    0.244 * u.m,
+    4.3866 * u.m,
+    0.160 * u.m,
+    0.130 * u.m,
+    0.171 * u.m,
+    0.171 * u.m,
+]  # Assuming approximately spherical hole
+cam_rad = [2.26, 3.96, 3.87, 4.0, 4.45, 2.86, 5.25, 2.86] * u.deg
+# Above found from the field of view calculation
+sec_rad = [
+    0.0 * u.m,
+    0.0 * u.m,
+    0.0 * u.m,
+    2.7 * u.m,
+    0.0 * u.m,
+    1.0 * u.m,
+    1.8 * u.m,
+    1.8 * u.m,
+]
+sct = [False, False, False, True, False, True, True, True]
+
+_MUON_CUTS = {
+    "Name": names,
+    "tail_cuts": tail_cuts,
+    "Impact": impact,
+    "RingWidth": ringwidth,
+    "total_pix": total_pix,
+    "min_pix": min_pix,
+    "CamRad": cam_rad,
+    "SecRad": sec_rad,
+    "SCT": sct,
+    "AngPixW": ang_pixel_width,
+    "HoleRad": hole_rad,
+}
+
+del names, tail_cuts, impact, ringwidth, total_pix, min_pix
+del ang_pixel_width, hole_rad, cam_rad, sec_rad, sct
+
+_telescope_setup_cache = {}
+
+
+def _telescope_setup(teldes):
+    """
+    Static per-telescope-type setup for `analyze_muon_event`: the index
+    into `_MUON_CUTS`, the mirror radius and a reusable
+    `MuonLineIntegrate` instance.  Telescopes of the same type share one
+    cache entry, so this is paid once per type instead of per telescope
+    per event.
+    """
+    name = str(teldes)
+    try:
+        return _telescope_setup_cache[name]
+    except KeyError:
+        pass
+
+    dict_index = _MUON_CUTS["Name"].index(name)
+    mir_rad = np.sqrt(teldes.optics.mirror_area.to("m2") / np.pi)
+    ctel = MuonLineIntegrate(
+        mir_rad,
+        hole_radius=_MUON_CUTS["HoleRad"][dict_index],
+        pixel_width=_MUON_CUTS["AngPixW"][dict_index],
+        sct_flag=_MUON_CUTS["SCT"][dict_index],
+        secondary_radius=_MUON_CUTS["SecRad"][dict_index],
+    )
+
+    setup = (dict_index, mir_rad, ctel)
+    _telescope_setup_cache[name] = setup
+    return setup
+
 
 def analyze_muon_event(event):
     """
@@ -33,92 +267,12 @@ def analyze_muon_event(event):
 
     """
 
-    names = [
-        "LST_LST_LSTCam",
-        "MST_MST_NectarCam",
-        "MST_MST_FlashCam",
-        "MST_SCT_SCTCam",
-        "SST_1M_DigiCam",
-        "SST_GCT_CHEC",
-        "SST_ASTRI_ASTRICam",
-        "SST_ASTRI_CHEC",
-    ]
-    tail_cuts = [
-        (5, 7),
-        (5, 7),
-        (10, 12),
-        (5, 7),
-        (5, 7),
-        (5, 7),
-        (5, 7),
-        (5, 7),
-    ]  # 10, 12?
-    impact = [
-        (0.2, 0.9),
-        (0.1, 0.95),
-        (0.2, 0.9),
-        (0.2, 0.9),
-        (0.1, 0.95),
-        (0.1, 0.95),
-        (0.1, 0.95),
-        (0.1, 0.95),
-    ] * u.m
-    ringwidth = [
-        (0.04, 0.08),
-        (0.02, 0.1),
-        (0.01, 0.1),
-        (0.02, 0.1),
-        (0.01, 0.5),
-        (0.02, 0.2),
-        (0.02, 0.2),
-        (0.02, 0.2),
-    ] * u.deg
-    total_pix = [1855.0, 1855.0, 1764.0, 11328.0, 1296.0, 2048.0, 2368.0, 2048]
-    # 8% (or 6%) as limit
-    min_pix = [148.0, 148.0, 141.0, 680.0, 104.0, 164.0, 142.0, 164]
-    # Need to either convert from the pixel area in m^2 or check the camera specs
-    ang_pixel_width = [0.1, 0.2, 0.18, 0.067, 0.24, 0.2, 0.17, 0.2, 0.163] * u.deg
-    # Found from TDRs (or the pixel area)
-    hole_rad = [
-        0.308 * u.m,
-        0.244 * u.m,
-        0.244 * u.m,
-        4.3866 * u.m,
-        0.160 * u.m,
-        0.130 * u.m,
-        0.171 * u.m,
-        0.171 * u.m,
-    ]  # Assuming approximately spherical hole
-    cam_rad = [2.26, 3.96, 3.87, 4.0, 4.45, 2.86, 5.25, 2.86] * u.deg
-    # Above found from the field of view calculation
-    sec_rad = [
-        0.0 * u.m,
-        0.0 * u.m,
-        0.0 * u.m,
-        2.7 * u.m,
-        0.0 * u.m,
-        1.0 * u.m,
-        1.8 * u.m,
-        1.8 * u.m,
-    ]
-    sct = [False, False, False, True, False, True, True, True]
-    # Added cleaning here. All these options should go to an input card
+    muon_cuts = _MUON_CUTS
+    logger.debug(muon_cuts)
+
     cleaning = True
 
-    muon_cuts = {
-        "Name": names,
-        "tail_cuts": tail_cuts,
-        "Impact": impact,
-        "RingWidth": ringwidth,
-        "total_pix": total_pix,
-        "min_pix": min_pix,
-        "CamRad": cam_rad,
-        "SecRad": sec_rad,
-        "SCT": sct,
-        "AngPixW": ang_pixel_width,
-        "HoleRad": hole_rad,
-    }
-    logger.debug(muon_cuts)
+    muon_ring_fit = MuonRingFitter(fit_method="kundu_chaudhuri")
 
     muonringlist = []  # [None] * len(event.dl0.tels_with_data)
     muonintensitylist = []  # [None] * len(event.dl0.tels_with_data)
@@ -137,9 +291,8 @@ def analyze_muon_event(event):
         # Get geometry
         teldes = event.inst.subarray.tel[telid]
         geom = teldes.camera.geometry
-        x, y = geom.pix_x, geom.pix_y
 
-        dict_index = muon_cuts["Name"].index(str(teldes))
+        dict_index, mir_rad, ctel = _telescope_setup(teldes)
         logger.debug("found an index of %d for camera %d", dict_index, geom.camera_name)
 
         tailcuts = muon_cuts["tail_cuts"][dict_index]
@@ -158,60 +311,75 @@ def analyze_muon_event(event):
         telescope_pointing = SkyCoord(
             alt=altval, az=event.mcheader.run_array_direction[0], frame=AltAz()
         )
-        camera_coord = SkyCoord(
-            x=x,
-            y=y,
-            frame=CameraFrame(
-                focal_length=teldes.optics.equivalent_focal_length,
-                rotation=geom.pix_rotation,
-                telescope_pointing=telescope_pointing,
-            ),
+        x, y = _nominal_pixel_positions(
+            geom, teldes.optics.equivalent_focal_length, telescope_pointing
         )
 
-        nom_coord = camera_coord.transform_to(NominalFrame(origin=telescope_pointing))
-        x = nom_coord.delta_az.to(u.deg)
-        y = nom_coord.delta_alt.to(u.deg)
-
         if cleaning:
             img = image * clean_mask
         else:
             img = image
 
-        muon_ring_fit = MuonRingFitter(fit_method="kundu_chaudhuri")
-
-        logger.debug(
-            "img: %s mask: %s, x=%s y= %s", np.sum(image), np.sum(clean_mask), x, y
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            # the sums are only needed for this message, do not pay for
+            # them per telescope per event when debug logging is off
+            logger.debug(
+                "img: %s mask: %s, x=%s y= %s",
+                np.sum(image),
+                np.count_nonzero(clean_mask),
+                x,
+                y,
+            )
 
         if img.sum() <= 0:  # Nothing left after tail cuts
             continue
 
         muonringparam = muon_ring_fit(x, y, image, clean_mask)
 
+        # do the ring refits on plain float64 arrays, reusing the same
+        # buffers in every pass instead of allocating four Quantity
+        # temporaries per iteration
+        xv = np.ascontiguousarray(x.to_value(u.deg))
+        yv = np.ascontiguousarray(y.to_value(u.deg))
+        dist = np.empty_like(xv)
+        ring_dist = np.empty_like(xv)
+
         for i in range(2):
-            dist = np.sqrt(
-                (x - muonringparam.center_x)**2
-                + (y - muonringparam.center_y)**2
-            )
-            ring_dist = np.abs(dist - muonringparam.radius)
+            cx = muonringparam.center_x.to_value(u.deg)
+            cy = muonringparam.center_y.to_value(u.deg)
+            r = muonringparam.radius.to_value(u.deg)
 
-            muonringparam = muon_ring_fit(
-                x, y, img, (ring_dist < muonringparam.radius * 0.4)
-            )
+            np.subtract(xv, cx, out=dist)
+            np.hypot(dist, yv - cy, out=dist)
+            np.subtract(dist, r, out=ring_dist)
+            np.abs(ring_dist, out=ring_dist)
 
-        dist_mask = (
-            np.abs(dist - muonringparam.radius) < muonringparam.radius * 0.4
-        )
-        pix_im = image * dist_mask
-        nom_dist = np.sqrt(
-            (muonringparam.center_x)**2
-            + (muonringparam.center_y)**2
+            muonringparam = muon_ring_fit(x, y, img, ring_dist < r * 0.4)
+
+        r = muonringparam.radius.to_value(u.deg)
+        dist_mask = np.abs(dist - r) < r * 0.4
+
+        # the cleaned image is dead after the refits; apply the ring mask
+        # into its buffer instead of allocating another image-sized array
+        if img is not image:
+            pix_im = np.multiply(image, dist_mask, out=img)
+        else:
+            pix_im = image * dist_mask
+        # evaluate the selection cuts on plain floats; Quantities only
+        # re-enter at the feature / intensity-fitter boundary below
+        nom_dist = np.hypot(
+            muonringparam.center_x.to_value(u.deg),
+            muonringparam.center_y.to_value(u.deg),
         )
+        # hoist the per-camera cut values out of the remaining uses, they
+        # are looked up several times below
+        cam_rad = muon_cuts["CamRad"][dict_index]
+        cam_rad_deg = cam_rad.to_value(u.deg)
+        impact_cut = muon_cuts["Impact"][dict_index]
+        ringwidth_cut = muon_cuts["RingWidth"][dict_index]
 
         minpix = muon_cuts["min_pix"][dict_index]  # 0.06*numpix #or 8%
 
-        mir_rad = np.sqrt(teldes.optics.mirror_area.to("m2") / np.pi)
-
         # Camera containment radius -  better than nothing - guess pixel
         # diameter of 0.11, all cameras are perfectly circular   cam_rad =
         # np.sqrt(numpix*0.11/(2.*np.pi))
@@ -219,13 +387,13 @@ def analyze_muon_event(event):
         if (
             npix_above_threshold(pix_im, tailcuts[0]) > 0.1 * minpix
             and npix_composing_ring(pix_im) > minpix
-            and nom_dist < muon_cuts["CamRad"][dict_index]
-            and muonringparam.radius < 1.5 * u.deg
-            and muonringparam.radius > 1.0 * u.deg
+            and nom_dist < cam_rad_deg
+            and r < 1.5
+            and r > 1.0
         ):
             muonringparam.containment = ring_containment(
                 muonringparam.radius,
-                muon_cuts["CamRad"][dict_index],
+                cam_rad,
                 muonringparam.center_x,
                 muonringparam.center_y,
             )
@@ -244,14 +412,6 @@ def analyze_muon_event(event):
             muonringlist.append(muonringparam)
             muonintensitylist.append(None)
 
-            ctel = MuonLineIntegrate(
-                mir_rad,
-                hole_radius=muon_cuts["HoleRad"][dict_index],
-                pixel_width=muon_cuts["AngPixW"][dict_index],
-                sct_flag=muon_cuts["SCT"][dict_index],
-                secondary_radius=muon_cuts["SecRad"][dict_index],
-            )
-
             if image.shape[0] == muon_cuts["total_pix"][dict_index]:
                 muonintensityoutput = ctel.fit_muon(
                     muonringparam.center_x,
@@ -280,15 +440,15 @@ def analyze_muon_event(event):
                 )
                 muonintensityoutput.ring_size = np.sum(pix_im)
 
-                dist_ringwidth_mask = np.abs(dist - muonringparam.radius) < (
-                    muonintensityoutput.ring_width
+                dist_ringwidth_mask = np.abs(dist - r) < (
+                    muonintensityoutput.ring_width.to_value(u.deg)
                 )
                 pix_ringwidth_im = image * dist_ringwidth_mask
                 idx_ringwidth = np.nonzero(pix_ringwidth_im)
 
                 muonintensityoutput.ring_pix_completeness = npix_above_threshold(
                     pix_ringwidth_im[idx_ringwidth], tailcuts[0]
-                ) / len(pix_im[idx_ringwidth])
+                ) / len(idx_ringwidth[0])
 
                 logger.debug(
                     "Tel %d Impact parameter = %s mir_rad=%s " "ring_width=%s",
@@ -299,13 +459,13 @@ def analyze_muon_event(event):
                 )
                 conditions = [
                     muonintensityoutput.impact_parameter * u.m
-                    < muon_cuts["Impact"][dict_index][1] * mir_rad,
+                    < impact_cut[1] * mir_rad,
                     muonintensityoutput.impact_parameter
-                    > muon_cuts["Impact"][dict_index][0],
+                    > impact_cut[0],
                     muonintensityoutput.ring_width
-                    < muon_cuts["RingWidth"][dict_index][1],
+                    < ringwidth_cut[1],
                     muonintensityoutput.ring_width
-                    > muon_cuts["RingWidth"][dict_index][0],
+                    > ringwidth_cut[0],
                 ]
 
                 if all(conditions):